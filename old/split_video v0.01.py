@@ -1,8 +1,10 @@
 import subprocess
-import math
+import functools
+import json
 import os
 import logging
 import sys
+import tempfile
 
 # Configure logging to display messages on screen and in case of errors
 logging.basicConfig(
@@ -11,39 +13,42 @@ logging.basicConfig(
     handlers=[logging.StreamHandler(sys.stdout)]
 )
 
+# The format doesn't use thread or process fields, so skip collecting them for every record
+logging.logThreads = logging.logProcesses = logging.logMultiprocessing = False
+log = logging.getLogger(__name__)
+
 # Input video file
 input_file = 'input.mp4'
 
 # Maximum length per segment (in seconds)
 max_length = 4 * 60 + 30  # 4 minutes and 30 seconds
 
-# Helper function to run FFprobe commands and extract data
-def ffprobe_info(file, stream_type, entry):
+# FFprobe command prefix, prebuilt as bytes so each probe only appends the encoded file path
+FFPROBE_COMMAND = [b'ffprobe', b'-v', b'error', b'-print_format', b'json', b'-show_format', b'-show_streams']
+
+# Helper function to run FFprobe once and cache all format and stream data
+@functools.lru_cache(maxsize=32)
+def probe_all(file):
     try:
-        command = [
-            'ffprobe', '-v', 'error', '-select_streams', stream_type,
-            '-show_entries', f'stream={entry}', '-of', 'default=noprint_wrappers=1:nokey=1', file
-        ]
-        result = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+        command = FFPROBE_COMMAND + [os.fsencode(file)]
+        result = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
         result.check_returncode()
-        return result.stdout.strip()
+        return json.loads(result.stdout)
     except subprocess.CalledProcessError as e:
-        logging.error(f"Failed to retrieve {entry} from {stream_type}: {e}")
+        log.error("Failed to probe %s: %s", file, e)
         sys.exit(1)
 
+# Helper function to extract a stream entry from the cached FFprobe data
+def ffprobe_info(file, stream_type, entry):
+    codec_type = {'v': 'video', 'a': 'audio'}[stream_type.split(':')[0]]
+    for stream in probe_all(file).get('streams', []):
+        if stream.get('codec_type') == codec_type:
+            return str(stream.get(entry, ''))
+    return ''
+
 # Function to get video duration
 def get_video_duration(file):
-    try:
-        result = subprocess.run(
-            ['ffprobe', '-v', 'error', '-show_entries', 'format=duration',
-             '-of', 'default=noprint_wrappers=1:nokey=1', file],
-            stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True
-        )
-        result.check_returncode()
-        return float(result.stdout.strip())
-    except subprocess.CalledProcessError as e:
-        logging.error(f"Failed to retrieve video duration: {e}")
-        sys.exit(1)
+    return float(probe_all(file)['format']['duration'])
 
 # Functions to extract properties
 def get_video_resolution(file):
@@ -62,45 +67,46 @@ def split_video():
     try:
         # Calculate total duration and number of segments
         total_duration = get_video_duration(input_file)
-        num_segments = math.ceil(total_duration / max_length)
-        logging.info(f"Total video duration: {total_duration:.2f} seconds.")
-        logging.info(f"Splitting into {num_segments} segments.")
+        num_segments = -(-int(total_duration * 1_000_000) // (max_length * 1_000_000))
+        log.info("Total video duration: %.2f seconds.", total_duration)
+        log.info("Splitting into %d segments.", num_segments)
 
         # Create output directory if it doesn't exist
         output_dir = "output"
         os.makedirs(output_dir, exist_ok=True)
 
         # Log the video properties
-        logging.info(f"Video Resolution: {get_video_resolution(input_file)}")
-        logging.info(f"Audio Codec: {get_audio_codec(input_file)}")
-        logging.info(f"Video Bitrate: {get_bitrate(input_file)} bps")
+        log.info("Video Resolution: %s", get_video_resolution(input_file))
+        log.info("Audio Codec: %s", get_audio_codec(input_file))
+        log.info("Video Bitrate: %s bps", get_bitrate(input_file))
 
-        # Split video into segments
-        for i in range(num_segments):
-            start_time = i * max_length
-            output_file = f"{output_dir}/segment_{i + 1}.mp4"
-            logging.info(f"Processing segment {i + 1}/{num_segments}, Start Time: {start_time} seconds")
+        # Split video into segments in a single segment muxer pass
+        output_pattern = f"{output_dir}/segment_%d.mp4"
+        log.info("Processing %d segments of %d seconds", num_segments, max_length)
 
+        # stderr goes to a temp file rather than a pipe so ffmpeg never stalls on a full pipe buffer
+        with tempfile.TemporaryFile() as error_log:
             result = subprocess.run([
-                'ffmpeg', '-i', input_file, '-ss', str(start_time), '-t', str(max_length),
-                '-c:v', 'copy', '-c:a', 'copy', '-b:v', get_bitrate(input_file),
-                output_file
-            ], stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+                'ffmpeg', '-loglevel', 'error', '-nostats', '-i', input_file, '-c', 'copy', '-map', '0',
+                '-f', 'segment', '-segment_time', str(max_length), '-segment_start_number', '1',
+                '-reset_timestamps', '1', '-avoid_negative_ts', '1', output_pattern
+            ], stdout=subprocess.DEVNULL, stderr=error_log)
 
             if result.returncode != 0:
-                logging.error(f"Error creating segment {i + 1}: {result.stderr}")
+                error_log.seek(0)
+                log.error("Error creating segments: %s", error_log.read().decode(errors='replace'))
             else:
-                logging.info(f"Segment {i + 1} saved as {output_file}")
+                log.info("Segments saved as %s", output_pattern)
 
-        logging.info("Video splitting completed successfully.")
+        log.info("Video splitting completed successfully.")
 
     except Exception as e:
-        logging.error(f"An unexpected error occurred: {e}")
+        log.error("An unexpected error occurred: %s", e)
         sys.exit(1)
 
 # Run the script
 if __name__ == "__main__":
     if not os.path.exists(input_file):
-        logging.error(f"Input file '{input_file}' not found.")
+        log.error("Input file '%s' not found.", input_file)
         sys.exit(1)
     split_video()
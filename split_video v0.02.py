@@ -11,7 +11,7 @@
 #
 # Requirements:
 # - FFmpeg and FFprobe must be installed and available in the system's PATH.
-# - Python must have the necessary libraries (subprocess, logging, math, sys, tkinter).
+# - Python standard library only (tkinter is needed for the GUI).
 #
 # Usage:
 # Run the script, select the input video file, choose the output directory, 
@@ -20,10 +20,15 @@
 
 
 import os
+import atexit
+import functools
+import json
 import subprocess
 import logging
-import math
+import stat
+import struct
 import sys
+import tempfile
 import tkinter as tk
 from tkinter import filedialog
 
@@ -33,112 +38,455 @@ logging.basicConfig(
     format='%(asctime)s - %(levelname)s - %(message)s'
 )
 
+# The format doesn't use thread or process fields, so skip collecting them for every record
+logging.logThreads = logging.logProcesses = logging.logMultiprocessing = False
+log = logging.getLogger(__name__)
+
+# ffprobe results are cached per file and reused until its size or modification time changes
+FFPROBE_CACHE_FILE = os.path.join(os.path.expanduser("~"), ".cache", "split_video", "ffprobe.json")
+
+# Prebuilt as bytes so each probe only appends the encoded input path
+FFPROBE_COMMAND = [b"ffprobe", b"-v", b"error", b"-print_format", b"json", b"-show_format", b"-show_streams"]
+
+# MP4 sample entry fourccs mapped to the codec names ffprobe reports for them
+MP4_CODEC_NAMES = {
+    b"avc1": "h264", b"avc3": "h264", b"hvc1": "hevc", b"hev1": "hevc", b"av01": "av1",
+    b"vp09": "vp9", b"mp4v": "mpeg4", b"mp4a": "aac", b"ac-3": "ac3", b"ec-3": "eac3",
+    b"Opus": "opus", b"fLaC": "flac", b".mp3": "mp3",
+}
+
+# Hardware H.264 encoders and the hwaccel they rely on, in order of preference. h264_vaapi is left
+# out since it only accepts frames already uploaded to the GPU, which copy outputs can't share.
+HW_H264_ENCODERS = [("cuda", "h264_nvenc"), ("qsv", "h264_qsv")]
+
+# Options that select the video encoder of an output
+VIDEO_CODEC_OPTIONS = ("-c", "-c:v", "-codec", "-codec:v", "-vcodec")
+
+# MPEG-TS packets are fixed size, so the ffmpeg stream is read a whole number of packets at a time
+TS_PACKET_SIZE = 188
+TS_PACKETS_PER_READ = 512
+
+# ffmpeg starts every MPEG-TS segment with an SDT (PID 0x11) followed by a PAT (PID 0)
+TS_SEGMENT_START_PIDS = (0x0000, 0x0011)
+
+# Shared hidden Tk root, created on the first dialog and reused by the others
+tk_root = None
+
+def get_tk_root():
+    """Returns the shared hidden Tk root window, creating it on first use."""
+    global tk_root
+    if tk_root is None:
+        tk_root = tk.Tk()
+        tk_root.withdraw()  # Hide the root window
+        atexit.register(tk_root.destroy)
+    return tk_root
+
 def browse_file():
     """Opens a GUI file explorer to select the input video file."""
-    root = tk.Tk()
-    root.withdraw()  # Hide the root window
     file_path = filedialog.askopenfilename(
+        parent=get_tk_root(),
         title="Select Video File",
         filetypes=[("MP4 files", "*.mp4"), ("All files", "*.*")]
     )
     if not file_path:
-        logging.error("No file selected. Exiting.")
+        log.error("No file selected. Exiting.")
         sys.exit(1)
     return file_path
 
 def browse_output_directory():
     """Opens a GUI file explorer to select the output directory."""
-    root = tk.Tk()
-    root.withdraw()  # Hide the root window
-    dir_path = filedialog.askdirectory(title="Select Output Directory")
+    dir_path = filedialog.askdirectory(parent=get_tk_root(), title="Select Output Directory")
     if not dir_path:
-        logging.error("No output directory selected. Exiting.")
+        log.error("No output directory selected. Exiting.")
         sys.exit(1)
     return dir_path
 
-def get_video_duration(input_file):
-    """Returns the duration of the video in seconds."""
+def load_probe_cache():
+    """Returns the on-disk ffprobe cache, or an empty cache if it is missing or unreadable."""
+    try:
+        with open(FFPROBE_CACHE_FILE, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def save_probe_cache(cache):
+    """Writes the ffprobe cache to disk, replacing the previous cache file."""
+    cache_dir = os.path.dirname(FFPROBE_CACHE_FILE)
+    temp_file = None
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        # A uniquely named temp file keeps concurrent runs from publishing each other's partial writes
+        with tempfile.NamedTemporaryFile(
+            "w", encoding="utf-8", dir=cache_dir, prefix="ffprobe.", suffix=".tmp", delete=False
+        ) as f:
+            temp_file = f.name
+            json.dump(cache, f)
+        os.replace(temp_file, FFPROBE_CACHE_FILE)
+    except OSError as e:
+        log.warning("Could not write ffprobe cache: %s", e)
+        if temp_file and os.path.exists(temp_file):
+            os.remove(temp_file)
+
+def iter_mp4_boxes(data, start, end):
+    """Yields the type, payload start and payload end of each MP4 box in data[start:end]."""
+    while start + 8 <= end:
+        size, box_type = struct.unpack_from(">I4s", data, start)
+        header_size = 8
+        if size == 1:
+            size, = struct.unpack_from(">Q", data, start + 8)
+            header_size = 16
+        elif size == 0:
+            size = end - start
+        if size < header_size or start + size > end:
+            raise ValueError(f"Truncated MP4 box {box_type!r}")
+        yield box_type, start + header_size, start + size
+        start += size
+
+def find_mp4_box(data, start, end, *path):
+    """Returns the payload start and end of the first box found along the given box type path."""
+    for box_type in path:
+        for found_type, payload_start, payload_end in iter_mp4_boxes(data, start, end):
+            if found_type == box_type:
+                start, end = payload_start, payload_end
+                break
+        else:
+            raise ValueError(f"MP4 box {box_type!r} not found")
+    return start, end
+
+def read_mp4_moov(f):
+    """Skips over the top-level MP4 boxes and returns the payload of the moov box, or None."""
+    while True:
+        header = f.read(8)
+        if len(header) < 8:
+            return None
+        size, box_type = struct.unpack(">I4s", header)
+        header_size = 8
+        if size == 1:
+            size, = struct.unpack(">Q", f.read(8))
+            header_size = 16
+        elif size == 0:
+            return f.read() if box_type == b"moov" else None
+        if size < header_size:
+            return None
+        if box_type == b"moov":
+            return f.read(size - header_size)
+        f.seek(size - header_size, os.SEEK_CUR)  # Skip mdat and friends without reading them
+
+def mp4_probe(input_file):
+    """Returns ffprobe-style metadata parsed from the MP4 moov box, or None if it cannot be parsed."""
+    try:
+        with open(input_file, "rb") as f:
+            file_size = os.fstat(f.fileno()).st_size
+            moov = read_mp4_moov(f)
+        if moov is None:
+            return None
+
+        mvhd, _ = find_mp4_box(moov, 0, len(moov), b"mvhd")
+        if moov[mvhd] == 1:
+            timescale, duration = struct.unpack_from(">IQ", moov, mvhd + 20)
+        else:
+            timescale, duration = struct.unpack_from(">II", moov, mvhd + 12)
+        if not timescale or not duration:
+            return None  # Fragmented MP4, the duration lives in the moof boxes
+        duration = duration / timescale
+
+        streams = []
+        for box_type, trak_start, trak_end in iter_mp4_boxes(moov, 0, len(moov)):
+            if box_type != b"trak":
+                continue
+            hdlr, _ = find_mp4_box(moov, trak_start, trak_end, b"mdia", b"hdlr")
+            handler = moov[hdlr + 8:hdlr + 12]
+            if handler not in (b"vide", b"soun"):
+                continue
+            stsd, _ = find_mp4_box(moov, trak_start, trak_end, b"mdia", b"minf", b"stbl", b"stsd")
+            sample_entry = stsd + 8  # Skip version, flags and entry count
+            codec_name = MP4_CODEC_NAMES.get(moov[sample_entry + 4:sample_entry + 8])
+            if codec_name is None:
+                return None  # Leave codecs we don't know to ffprobe
+            if handler == b"vide":
+                width, height = struct.unpack_from(">HH", moov, sample_entry + 32)
+                streams.append({"codec_type": "video", "codec_name": codec_name, "width": width, "height": height})
+            else:
+                streams.append({"codec_type": "audio", "codec_name": codec_name})
+    except (OSError, ValueError, IndexError, struct.error) as e:
+        log.debug("Could not parse MP4 metadata of %s: %s", input_file, e)
+        return None
+
+    return {
+        "streams": streams,
+        "format": {"duration": f"{duration:.6f}", "bit_rate": str(int(file_size * 8 / duration))},
+    }
+
+@functools.lru_cache(maxsize=32)
+def cached_ffprobe(input_file, file_size, file_mtime_ns):
+    """Returns the metadata of the file, running ffprobe only if the MP4 parse fails and the on-disk cache is stale."""
+    info = mp4_probe(input_file)
+    if info is not None:
+        return info
+
+    cache = load_probe_cache()
+    entry = cache.get(input_file)
+    if entry and entry["size"] == file_size and entry["mtime_ns"] == file_mtime_ns:
+        return entry["info"]
+
     result = subprocess.run(
-        ["ffprobe", "-v", "error", "-select_streams", "v:0", "-show_entries", "format=duration", "-of", "default=noprint_wrappers=1:nokey=1", input_file],
-        stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True
+        FFPROBE_COMMAND + [os.fsencode(input_file)],
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE
     )
-    return float(result.stdout.strip())
+    if result.returncode != 0:
+        raise subprocess.CalledProcessError(
+            result.returncode, result.args, output=result.stdout, stderr=result.stderr.decode(errors="replace")
+        )
+    info = json.loads(result.stdout)
+    if "format" in info:  # Only cache probes that actually found a container
+        cache[input_file] = {"size": file_size, "mtime_ns": file_mtime_ns, "info": info}
+        save_probe_cache(cache)
+    return info
+
+def probe_all(input_file):
+    """Returns the format and stream metadata of the video from a single (cached) ffprobe call."""
+    file_stat = os.stat(input_file)
+    return cached_ffprobe(os.path.abspath(input_file), file_stat.st_size, file_stat.st_mtime_ns)
+
+def get_stream(input_file, codec_type):
+    """Returns the metadata of the first stream of the given type, or an empty dict."""
+    for stream in probe_all(input_file).get("streams", []):
+        if stream.get("codec_type") == codec_type:
+            return stream
+    return {}
+
+def get_video_duration(input_file):
+    """Returns the duration of the video in seconds."""
+    return float(probe_all(input_file)["format"]["duration"])
 
 def get_video_resolution(input_file):
     """Returns the resolution of the video."""
-    result = subprocess.run(
-        ["ffprobe", "-v", "error", "-select_streams", "v:0", "-show_entries", "stream=width,height", "-of", "csv=p=0", input_file],
-        stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True
-    )
-    return result.stdout.strip()
+    stream = get_stream(input_file, "video")
+    if not stream:
+        return ""
+    return f"{stream.get('width', '')},{stream.get('height', '')}"
 
 def get_audio_codec(input_file):
     """Returns the audio codec of the input video."""
-    result = subprocess.run(
-        ["ffprobe", "-v", "error", "-select_streams", "a:0", "-show_entries", "stream=codec_name", "-of", "default=noprint_wrappers=1:nokey=1", input_file],
-        stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True
-    )
-    return result.stdout.strip()
+    return get_stream(input_file, "audio").get("codec_name", "")
 
 def get_bitrate(input_file):
     """Returns the video bitrate in bits per second."""
-    result = subprocess.run(
-        ["ffprobe", "-v", "error", "-select_streams", "v:0", "-show_entries", "format=bit_rate", "-of", "default=noprint_wrappers=1:nokey=1", input_file],
-        stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True
-    )
-    return int(result.stdout.strip())
+    return int(probe_all(input_file)["format"]["bit_rate"])
 
-def generate_unique_filename(output_file):
-    """Generates a unique filename if the file already exists."""
-    base, ext = os.path.splitext(output_file)
+def check_input_file(input_file):
+    """Raises FileNotFoundError unless the input file exists and is a regular file."""
+    try:
+        mode = os.stat(input_file).st_mode
+    except FileNotFoundError as e:
+        raise FileNotFoundError(f"Input file '{input_file}' not found.") from e
+    if not stat.S_ISREG(mode):
+        raise FileNotFoundError(f"Input file '{input_file}' is not a regular file.")
+
+def generate_unique_filename(output_pattern, num_segments, existing):
+    """Generates a unique segment filename pattern and reserves its segment files in existing.
+
+    existing is the set of paths already taken, built from a single scan of the output directory.
+    """
+    base, ext = os.path.splitext(output_pattern)
     counter = 1
-    while os.path.exists(output_file):
-        output_file = f"{base}_{counter}{ext}"
+    while any(output_pattern % (i + 1) in existing for i in range(num_segments)):
+        output_pattern = f"{base}_{counter}{ext}"
         counter += 1
-    return output_file
+    # Reserve the names so later renditions in the same ffmpeg call can't pick the same pattern
+    existing.update(output_pattern % (i + 1) for i in range(num_segments))
+    return output_pattern
 
-def split_video(input_file, output_directory, segment_length=270):
-    """Splits the input video into segments with the given length in seconds."""
+@functools.lru_cache(maxsize=None)
+def get_hw_h264_encoder():
+    """Returns the first hardware H.264 encoder that works on this machine, or None."""
+    result = subprocess.run(
+        ["ffmpeg", "-hide_banner", "-hwaccels"], stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True
+    )
+    hwaccels = set(result.stdout.split()[3:])  # Skip the "Hardware acceleration methods:" header
+    for hwaccel, encoder in HW_H264_ENCODERS:
+        if hwaccel not in hwaccels:
+            continue
+        # Being compiled in doesn't mean the device exists, so try encoding a single frame
+        result = subprocess.run(
+            ["ffmpeg", "-hide_banner", "-loglevel", "error", "-f", "lavfi", "-i", "color=size=256x256",
+             "-frames:v", "1", "-c:v", encoder, "-f", "null", "-"],
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+        )
+        if result.returncode == 0:
+            return encoder
+    return None
+
+def get_cpu_count():
+    """Returns the number of CPUs this process is allowed to run on."""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:  # sched_getaffinity is only available on some Unix platforms
+        return os.cpu_count() or 1
+
+def is_video_reencode(codec_args):
+    """Returns True if the codec arguments re-encode the video instead of copying it."""
+    return any(
+        option in VIDEO_CODEC_OPTIONS and value != "copy"
+        for option, value in zip(codec_args, codec_args[1:])
+    )
+
+def resolve_h264_encoder(codec_args, encoder):
+    """Replaces the generic "h264" video codec in the codec arguments with the given encoder."""
+    return [
+        encoder if arg == "h264" and i > 0 and codec_args[i - 1] in VIDEO_CODEC_OPTIONS else arg
+        for i, arg in enumerate(codec_args)
+    ]
+
+def split_video(input_file, output_directory, segment_length=270, renditions=None, hwaccel=False):
+    """Splits the input video into segments with the given length in seconds.
+
+    renditions is an optional list of (segment_time, output_pattern, codec_args) tuples. All of
+    them are produced by a single ffmpeg call that demuxes and decodes the input only once.
+    Defaults to one stream-copied rendition named segment_%d.mp4.
+
+    When a rendition re-encodes the video and hwaccel is set, decoding uses -hwaccel auto and a
+    generic "-c:v h264" becomes a working hardware H.264 encoder, or libx264 if none is found.
+    Encoders named explicitly, such as libx264, are always used as given.
+    """
+    check_input_file(input_file)  # Fail fast instead of letting ffprobe choke on a bad path
+    if renditions is None:
+        renditions = [(segment_length, "segment_%d.mp4", ["-c", "copy"])]
     try:
         total_duration = get_video_duration(input_file)
-        num_segments = math.ceil(total_duration / segment_length)
         resolution = get_video_resolution(input_file)
         audio_codec = get_audio_codec(input_file)
         bitrate = get_bitrate(input_file)
         
-        logging.info(f"Total video duration: {total_duration:.2f} seconds.")
-        logging.info(f"Splitting into {num_segments} segments.")
-        logging.info(f"Video Resolution: {resolution}")
-        logging.info(f"Audio Codec: {audio_codec}")
-        logging.info(f"Video Bitrate: {bitrate} bps")
+        log.info("Total video duration: %.2f seconds.", total_duration)
+        log.info("Video Resolution: %s", resolution)
+        log.info("Audio Codec: %s", audio_codec)
+        log.info("Video Bitrate: %d bps", bitrate)
         
-        for i in range(num_segments):
-            start_time = i * segment_length
-            output_file = os.path.join(output_directory, f"segment_{i + 1}.mp4")
-            output_file = generate_unique_filename(output_file)  # Ensure unique filename
-            logging.info(f"Processing segment {i + 1}/{num_segments}, Start Time: {start_time} seconds")
-            
-            command = [
-                "ffmpeg", "-i", input_file, "-ss", str(start_time), "-t", str(segment_length),
-                "-c", "copy", "-avoid_negative_ts", "1", output_file
+        # A single segment muxer pass demuxes the input once instead of once per segment and rendition
+        command = ["ffmpeg", "-loglevel", "error", "-nostats"]
+        num_encodes = sum(is_video_reencode(codec_args) for _, _, codec_args in renditions)
+        # Every encoder would otherwise start a thread per core, so share the cores between them
+        encode_threads = str(max(1, get_cpu_count() // num_encodes)) if num_encodes else None
+        hw_encoder = None
+        if hwaccel and num_encodes:
+            # Stream copies never decode, so hardware acceleration only matters when re-encoding
+            command += ["-hwaccel", "auto"]
+            hw_encoder = get_hw_h264_encoder()
+            log.info("Hardware H.264 encoder: %s", hw_encoder or "none found, using libx264")
+        command += ["-i", input_file]
+        output_patterns = []
+        # One directory scan up front instead of an exists() check per segment and candidate
+        existing = {os.path.join(output_directory, entry.name) for entry in os.scandir(output_directory)}
+        for segment_time, output_pattern, codec_args in renditions:
+            if is_video_reencode(codec_args) and "-threads" not in codec_args:
+                codec_args = ["-threads", encode_threads, *codec_args]
+            if hwaccel:
+                codec_args = resolve_h264_encoder(codec_args, hw_encoder or "libx264")
+            # Integer ceiling division in microseconds avoids float error at segment boundaries
+            num_segments = -(-int(total_duration * 1_000_000) // int(segment_time * 1_000_000))
+            output_pattern = os.path.join(output_directory, output_pattern)
+            output_pattern = generate_unique_filename(output_pattern, num_segments, existing)  # Ensure unique filenames
+            output_patterns.append(output_pattern)
+            log.info("Splitting into %d segments of %s seconds as %s", num_segments, segment_time, output_pattern)
+            command += [
+                "-map", "0", *codec_args,
+                "-f", "segment", "-segment_time", str(segment_time), "-segment_start_number", "1",
+                "-reset_timestamps", "1", "-avoid_negative_ts", "1", output_pattern
             ]
-            result = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+        # stderr goes to a temp file rather than a pipe so ffmpeg never stalls on a full pipe buffer
+        with tempfile.TemporaryFile() as error_log:
+            result = subprocess.run(command, stdout=subprocess.DEVNULL, stderr=error_log)
             
             if result.returncode != 0:
-                logging.error(f"Error creating segment {i + 1}: {result.stderr}")
+                error_log.seek(0)
+                log.error("Error creating segments: %s", error_log.read().decode(errors="replace"))
                 sys.exit(1)
             else:
-                logging.info(f"Segment {i + 1} saved as {output_file}")
+                log.info("Segments saved as %s", ", ".join(output_patterns))
 
-        logging.info("Video splitting completed successfully.")
+        log.info("Video splitting completed successfully.")
     except subprocess.CalledProcessError as e:
-        logging.error(f"Subprocess error: {e.stderr}")
+        log.error("Subprocess error: %s", e.stderr)
+        sys.exit(1)
+    except Exception as e:
+        log.error("An unexpected error occurred: %s", e)
         sys.exit(1)
+
+def is_ts_segment_start(packet):
+    """Returns True if the MPEG-TS packet is a PAT or SDT flagged as a discontinuity, as at the start of a segment."""
+    pid = ((packet[1] & 0x1F) << 8) | packet[2]
+    has_adaptation_field = packet[3] & 0x20
+    return pid in TS_SEGMENT_START_PIDS and has_adaptation_field and packet[4] > 0 and packet[5] & 0x80
+
+def split_ts_segments(stream, on_segment_callback):
+    """Passes each complete segment of an MPEG-TS stream to the callback and returns the final, unfinished one."""
+    segment = bytearray()
+    has_payload = False  # Whether the segment holds more than its leading SDT and PAT
+    while True:
+        chunk = stream.read(TS_PACKET_SIZE * TS_PACKETS_PER_READ)
+        if not chunk:
+            break
+        # A short trailing packet can only come from a truncated stream, so it is dropped
+        for offset in range(0, len(chunk) - TS_PACKET_SIZE + 1, TS_PACKET_SIZE):
+            packet = chunk[offset:offset + TS_PACKET_SIZE]
+            if is_ts_segment_start(packet):
+                if has_payload:
+                    on_segment_callback(bytes(segment))
+                    segment.clear()
+                    has_payload = False
+            else:
+                has_payload = True
+            segment += packet
+    return bytes(segment)
+
+def split_video_stream(input_file, on_segment_callback, segment_length=270):
+    """Splits the input video into MPEG-TS segments and passes each one to the callback as bytes."""
+    check_input_file(input_file)
+    try:
+        command = [
+            "ffmpeg", "-loglevel", "error", "-nostats", "-i", input_file, "-c", "copy", "-map", "0",
+            "-f", "segment", "-segment_time", str(segment_length), "-segment_format", "mpegts",
+            # Each segment starts with a fresh muxer, which flags its first SDT and PAT as discontinuities
+            "-segment_format_options", "mpegts_flags=+initial_discontinuity",
+            # strftime naming lets every segment reopen the same literal pipe:1 output
+            "-strftime", "1", "pipe:1"
+        ]
+        with tempfile.TemporaryFile() as error_log:
+            process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=error_log)
+            num_segments = 0
+
+            def on_segment(segment):
+                nonlocal num_segments
+                num_segments += 1
+                on_segment_callback(segment)
+
+            try:
+                with process.stdout:
+                    segment = split_ts_segments(process.stdout, on_segment)
+            except BaseException:
+                process.kill()  # Don't leave ffmpeg running if the callback or the reader fails
+                raise
+            finally:
+                returncode = process.wait()
+
+            if returncode != 0:
+                error_log.seek(0)
+                log.error("Error creating segments: %s", error_log.read().decode(errors="replace"))
+                sys.exit(1)
+            if segment:
+                on_segment(segment)
+
+        log.info("Video streaming completed successfully, %d segments sent.", num_segments)
     except Exception as e:
-        logging.error(f"An unexpected error occurred: {e}")
+        log.error("An unexpected error occurred: %s", e)
         sys.exit(1)
 
 if __name__ == "__main__":
     input_file = browse_file()
     output_directory = browse_output_directory()
-    split_video(input_file, output_directory)
+    try:
+        split_video(input_file, output_directory)
+    except OSError as e:
+        log.error("%s", e)
+        sys.exit(1)
@@ -0,0 +1,59 @@
+import importlib.util
+import io
+import os
+
+# The script's file name has a space in it, so it is loaded from its path instead of imported
+SCRIPT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "split_video v0.02.py")
+spec = importlib.util.spec_from_file_location("split_video", SCRIPT)
+split_video = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(split_video)
+
+SDT_PID = 0x0011
+PAT_PID = 0x0000
+PMT_PID = 0x1000
+VIDEO_PID = 0x0100
+
+
+def ts_packet(pid, discontinuity=False, fill=0x00):
+    """Builds a 188-byte MPEG-TS packet, flagged as a discontinuity through its adaptation field if asked."""
+    header = bytes([0x47, (pid >> 8) & 0x1F, pid & 0xFF])
+    if discontinuity:
+        return header + bytes([0x30, 1, 0x80]) + bytes([fill]) * 182
+    return header + bytes([0x10]) + bytes([fill]) * 184
+
+
+def ts_segment(fill):
+    """Builds a segment the way ffmpeg's MPEG-TS muxer starts one: SDT, PAT, PMT, then media and repeated tables."""
+    return b"".join([
+        ts_packet(SDT_PID, discontinuity=True, fill=fill),
+        ts_packet(PAT_PID, discontinuity=True, fill=fill),
+        ts_packet(PMT_PID, fill=fill),
+        *[ts_packet(VIDEO_PID, fill=fill)] * 700,
+        ts_packet(SDT_PID, fill=fill),
+        ts_packet(PAT_PID, fill=fill),
+        ts_packet(PMT_PID, fill=fill),
+        *[ts_packet(VIDEO_PID, fill=fill)] * 5,
+    ])
+
+
+def test_split_ts_segments_starts_each_segment_at_its_sdt():
+    first, second = ts_segment(0x01), ts_segment(0x02)
+    segments = []
+
+    segments.append(split_video.split_ts_segments(io.BytesIO(first + second), segments.append))
+
+    assert segments == [first, second]
+    for segment, fill in zip(segments, (0x01, 0x02)):
+        assert segment[:split_video.TS_PACKET_SIZE] == ts_packet(SDT_PID, discontinuity=True, fill=fill)
+        assert segment[split_video.TS_PACKET_SIZE:2 * split_video.TS_PACKET_SIZE] == \
+            ts_packet(PAT_PID, discontinuity=True, fill=fill)
+
+
+def test_split_ts_segments_drops_short_trailing_packet():
+    segment = ts_segment(0x01)
+    segments = []
+
+    tail = split_video.split_ts_segments(io.BytesIO(segment + b"\x47\x00"), segments.append)
+
+    assert segments == []
+    assert tail == segment